@@ -5,20 +5,277 @@ import threading
 import datetime
 import json
 import struct
+import time
+import functools
+import signal
+import cProfile
+import pstats
+import io
+import os
 
 CLIENT_CONFIG = {
     "host": "127.0.0.1",
     "port": 3147,
     "verify_password": "passwd@gout",
+    "profile": False,  # 开启后可通过 SIGUSR1/SIGUSR2 剖析
+    "profile_window": 30,  # cProfile 窗口秒数
 }
 
+LOG_NAME = "gout"
+
 
 def log(msg):
     """统一日志打印，带时间"""
     now = datetime.datetime.now()
     timestamp = now.strftime("%Y_%m_%d-%H:%M.") + f"{now.microsecond // 100:04d}"
     # 解释：microsecond//100得到前4位毫秒精度
-    print(f"[gout {timestamp}] {msg}")
+    print(f"[{LOG_NAME} {timestamp}] {msg}")
+
+
+class ThreadProbe:
+    """单个转发线程的本地统计，避免每个数据块都竞争 Profiler 的全局锁
+
+    begin/end 只由所属线程调用；dump 和窗口结束时通过 flush 合并到 Profiler
+    """
+
+    def __init__(self, profiler, label: str):
+        self.profiler = profiler
+        self.label = label
+        self.lock = threading.Lock()
+        self.probes = {}  # 尚未合并的探针统计
+        self.cpu = 0.0  # 尚未合并的线程 CPU 秒数
+        self.last_cpu = time.thread_time()
+        self.window_id = 0  # self.profile 所属的剖析窗口
+        self.profile = None
+        self.active = None  # begin/end 之间处于启用状态的 profile
+
+    def begin(self) -> int:
+        """开始一次计时；按线程剖析时在窗口内启用本线程的 cProfile"""
+        window_id = self.profiler.window_id
+        with self.lock:
+            if not window_id:
+                self.profile = None
+            elif self.profiler.per_thread and self.window_id != window_id:
+                self.window_id = window_id
+                self.profile = cProfile.Profile()
+            self.active = self.profile
+        if self.active is not None:
+            self.active.enable()
+        return time.perf_counter_ns()
+
+    def end(self, name: str, start: int):
+        elapsed = time.perf_counter_ns() - start
+        if self.active is not None:
+            self.active.disable()
+        now = time.thread_time()
+        with self.lock:
+            self.active = None
+            add_probe(self.probes, name, elapsed)
+            self.cpu += now - self.last_cpu
+            self.last_cpu = now
+
+    def record(self, name: str, elapsed_ns: int):
+        with self.lock:
+            add_probe(self.probes, name, elapsed_ns)
+
+    def flush(self):
+        with self.lock:
+            probes, self.probes = self.probes, {}
+            cpu, self.cpu = self.cpu, 0.0
+        self.profiler.merge(self.label, probes, cpu)
+
+    def take_profile(self, window_id: int):
+        """取走属于该窗口且当前未启用的 profile"""
+        with self.lock:
+            if self.window_id != window_id or self.active is not None:
+                return None
+            profile, self.profile = self.profile, None
+            return profile
+
+
+def add_probe(probes: dict, name: str, elapsed_ns: int):
+    """累加一次探针耗时：[调用次数, 总耗时 ns, 最大耗时 ns]"""
+    stat = probes.setdefault(name, [0, 0, 0])
+    stat[0] += 1
+    stat[1] += elapsed_ns
+    stat[2] = max(stat[2], elapsed_ns)
+
+
+class Profiler:
+    """可选的性能剖析：cProfile 时间窗口、热路径耗时探针、按隧道统计 CPU"""
+
+    def __init__(self, enabled: bool = False, window: int = 30):
+        self.enabled = enabled
+        self.window = window
+        self.lock = threading.Lock()
+        self.probes = {}  # 探针名 -> [调用次数, 总耗时 ns, 最大耗时 ns]
+        self.tunnel_cpu = {}  # 隧道标签 -> 线程 CPU 秒数
+        self.threads = set()  # 活动的 ThreadProbe
+        self.finished = []  # 窗口内已结束线程留下的 profile
+        self.local = threading.local()
+        self.profile = None
+        self.timer = None
+        self.window_id = 0  # 当前剖析窗口编号，0 表示未开启
+        self.windows = 0
+        # Python 3.12 起 cProfile 基于 sys.monitoring，一个 Profile 即可覆盖所有线程；
+        # 更早的版本由各转发线程在窗口内启用自己的 Profile，结束时合并
+        self.per_thread = sys.version_info < (3, 12)
+
+    def timed(self, name: str):
+        """装饰器：记录函数调用次数和耗时，未开启剖析时原样返回函数"""
+
+        def decorator(fn):
+            if not self.enabled:
+                return fn
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter_ns()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    elapsed = time.perf_counter_ns() - start
+                    probe = getattr(self.local, "probe", None)
+                    if probe is None:
+                        self.record(name, elapsed)
+                    else:
+                        probe.record(name, elapsed)
+
+            return wrapper
+
+        return decorator
+
+    def thread_probe(self, label: str) -> ThreadProbe:
+        """为当前转发线程创建本地统计，未开启剖析时返回 None"""
+        if not self.enabled:
+            return None
+        probe = ThreadProbe(self, label)
+        self.local.probe = probe
+        with self.lock:
+            self.threads.add(probe)
+        return probe
+
+    def release(self, probe: ThreadProbe):
+        """转发线程结束时合并其统计，并把本窗口的 profile 留给 stop()"""
+        probe.flush()
+        profile = probe.take_profile(probe.window_id)
+        with self.lock:
+            self.threads.discard(probe)
+            if profile is not None and probe.window_id == self.window_id:
+                self.finished.append(profile)
+        if getattr(self.local, "probe", None) is probe:
+            self.local.probe = None
+
+    def record(self, name: str, elapsed_ns: int):
+        with self.lock:
+            add_probe(self.probes, name, elapsed_ns)
+
+    def account(self, label: str, cpu: float):
+        """累计某个隧道消耗的线程 CPU 时间"""
+        with self.lock:
+            self.tunnel_cpu[label] = self.tunnel_cpu.get(label, 0.0) + cpu
+
+    def merge(self, label: str, probes: dict, cpu: float):
+        with self.lock:
+            for name, (count, total_ns, max_ns) in probes.items():
+                stat = self.probes.setdefault(name, [0, 0, 0])
+                stat[0] += count
+                stat[1] += total_ns
+                stat[2] = max(stat[2], max_ns)
+            if cpu:
+                self.tunnel_cpu[label] = self.tunnel_cpu.get(label, 0.0) + cpu
+
+    def flush_threads(self):
+        with self.lock:
+            probes = list(self.threads)
+        for probe in probes:
+            probe.flush()
+
+    def toggle(self):
+        """开始一个剖析窗口；窗口进行中再次调用则提前结束并输出结果"""
+        self.flush_threads()  # 窗口开始前的统计不计入本窗口
+        with self.lock:
+            running = self.timer is not None
+            if not running:
+                self.probes = {}
+                self.tunnel_cpu = {}
+                self.windows += 1
+                self.window_id = self.windows
+                self.finished = []
+                if not self.per_thread:
+                    self.profile = cProfile.Profile()
+                    self.profile.enable()
+                self.timer = threading.Timer(self.window, self.stop)
+                self.timer.daemon = True
+                self.timer.start()
+        if running:
+            self.stop()
+            return
+        log(f"profiling started for {self.window}s")
+
+    def stop(self):
+        with self.lock:
+            if self.timer is None:
+                return
+            self.timer.cancel()
+            self.timer = None
+            window_id, self.window_id = self.window_id, 0
+            profile, self.profile = self.profile, None
+            threads = list(self.threads)
+            profiles, self.finished = self.finished, []
+        if profile is not None:
+            profile.disable()
+            profiles.append(profile)
+        for probe in threads:
+            # 窗口结束时正在发送数据的线程，其本窗口的 profile 会被丢弃
+            thread_profile = probe.take_profile(window_id)
+            if thread_profile is not None:
+                profiles.append(thread_profile)
+        if profiles:
+            now = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+            path = f"{LOG_NAME}-{os.getpid()}-{now}.prof"
+            out = io.StringIO()
+            stats = pstats.Stats(profiles[0], stream=out)
+            for thread_profile in profiles[1:]:
+                stats.add(thread_profile)
+            stats.dump_stats(path)
+            stats.sort_stats("cumulative").print_stats(20)
+            log(f"profile saved to {path}\n{out.getvalue()}")
+        else:
+            log("no forwarding activity profiled in this window")
+        self.dump()
+
+    def dump(self):
+        """打印探针耗时和各隧道 CPU 占用"""
+        self.flush_threads()
+        with self.lock:
+            probes = dict(self.probes)
+            tunnel_cpu = dict(self.tunnel_cpu)
+        for name, (count, total_ns, max_ns) in sorted(probes.items()):
+            log(
+                f"probe {name}: calls={count} total={total_ns / 1e6:.2f}ms "
+                f"avg={total_ns / count / 1e3:.1f}us max={max_ns / 1e3:.1f}us"
+            )
+        for label, cpu in sorted(tunnel_cpu.items(), key=lambda x: -x[1]):
+            log(f"tunnel {label}: cpu={cpu:.3f}s")
+
+    def install_signals(self):
+        """SIGUSR1 开关剖析窗口，SIGUSR2 立即打印统计（需在主线程调用）"""
+        if not self.enabled or not hasattr(signal, "SIGUSR1"):
+            return
+        # 在信号处理函数中另起线程，避免与持有锁的主线程死锁
+        signal.signal(
+            signal.SIGUSR1,
+            lambda *_: threading.Thread(target=self.toggle, daemon=True).start(),
+        )
+        signal.signal(
+            signal.SIGUSR2,
+            lambda *_: threading.Thread(target=self.dump, daemon=True).start(),
+        )
+        log(f"profiling hooks ready: kill -USR1 {os.getpid()} to profile")
+
+
+PROFILER = Profiler(CLIENT_CONFIG["profile"], CLIENT_CONFIG["profile_window"])
 
 
 class ForwardClient:
@@ -61,16 +318,26 @@ class ForwardClient:
             self.start_tunnel()
 
     def start_tunnel(self):
+        label = f"tcp:{self.forward_port}"
+
         def _fwd(src: socket.socket, dst: socket.socket):
+            probe = PROFILER.thread_probe(label)
             try:
                 while True:
                     data = src.recv(4096)
                     if not data:
                         break
+                    if probe is None:
+                        dst.sendall(data)
+                        continue
+                    start = probe.begin()
                     dst.sendall(data)
+                    probe.end("tcp.send", start)
             except Exception:
                 pass  # 连接关闭是正常行为，不需要记录
             finally:
+                if probe is not None:
+                    PROFILER.release(probe)
                 # 安全地关闭 socket，忽略所有错误
                 for sock in [src, dst]:
                     try:
@@ -85,9 +352,9 @@ class ForwardClient:
         def handle_new_connection():
             """处理每个新连接：连接到服务器数据端口和本地服务"""
             try:
-                # 连接到服务器数据端口
+                # 连接到服务器数据端口（集群中必须回到持有控制连接的节点）
                 data_conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                data_conn.connect((self.host, self.data_port))
+                data_conn.connect((self.control_conn.getpeername()[0], self.data_port))
 
                 # 连接到本地服务
                 local_conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -130,7 +397,9 @@ class ForwardClient:
 
     def start_udp_tunnel(self):
         """UDP 转发：通过 TCP 控制连接接收/发送 UDP 数据"""
+        label = f"udp:{self.forward_port}"
 
+        @PROFILER.timed("udp.encode")
         def encode_udp_packet(addr: tuple, data: bytes) -> bytes:
             """编码 UDP 包：4字节长度 + IP + 端口 + 数据"""
             ip_bytes = socket.inet_aton(addr[0])
@@ -138,6 +407,7 @@ class ForwardClient:
             data_len = struct.pack("!I", len(data))
             return data_len + ip_bytes + port_bytes + data
 
+        @PROFILER.timed("udp.decode")
         def decode_udp_packet(packet: bytes) -> tuple:
             """解码 UDP 包：返回 (addr, data)"""
             data_len = struct.unpack("!I", packet[:4])[0]
@@ -155,6 +425,7 @@ class ForwardClient:
 
         # 从服务器接收 UDP 数据并转发到本地
         def server_to_local():
+            probe = PROFILER.thread_probe(label)
             buffer = b""
             while True:
                 try:
@@ -162,6 +433,7 @@ class ForwardClient:
                     if not data:
                         log("Control connection closed")
                         break
+                    start = probe.begin() if probe else 0
                     buffer += data
 
                     # 处理完整的包
@@ -188,9 +460,11 @@ class ForwardClient:
 
                             # 启动接收线程
                             def recv_from_local(sock, l_port):
+                                probe = PROFILER.thread_probe(label)
                                 while True:
                                     try:
                                         reply_data, _ = sock.recvfrom(65535)
+                                        start = probe.begin() if probe else 0
                                         # 根据本地端口找到对应的远程客户端
                                         if l_port in session_map:
                                             r_addr = session_map[l_port]
@@ -203,9 +477,13 @@ class ForwardClient:
                                             log(
                                                 f"UDP reply to {r_addr[0]}:{r_addr[1]}, {len(reply_data)} bytes"
                                             )
+                                        if probe:
+                                            probe.end("udp.to_server", start)
                                     except Exception as e:
                                         log(f"Recv from local error: {e}")
                                         break
+                                if probe:
+                                    PROFILER.release(probe)
 
                             threading.Thread(
                                 target=recv_from_local,
@@ -220,9 +498,14 @@ class ForwardClient:
                             f"UDP from {remote_addr[0]}:{remote_addr[1]} -> local:{self.forward_port}, {len(udp_data)} bytes"
                         )
 
+                    if probe:
+                        probe.end("udp.to_local", start)
+
                 except Exception as e:
                     log(f"Server to local error: {e}")
                     break
+            if probe:
+                PROFILER.release(probe)
 
         t1 = threading.Thread(target=server_to_local, daemon=True)
         t1.start()
@@ -251,6 +534,13 @@ CONFIGURATION:
     - host: Server address (default: 127.0.0.1)
     - port: Server port (default: 3147)
     - verify_password: Authentication password
+    - profile: Enable profiling hooks (default: False)
+    - profile_window: cProfile window in seconds (default: 30)
+
+PROFILING:
+    With profile enabled, send signals to the client process:
+    - kill -USR1 <pid>   Start a cProfile window (send again to stop early)
+    - kill -USR2 <pid>   Print probe timings and per-tunnel CPU now
 
 EXAMPLES:
     # Forward local TCP port 80 (HTTP server)
@@ -314,6 +604,8 @@ if __name__ == "__main__":
     print(f"Local port: {forward_port}")
     print()
 
+    PROFILER.install_signals()
+
     try:
         client = ForwardClient(host, port, protocol, forward_port)
     except KeyboardInterrupt:
@@ -4,7 +4,20 @@ import datetime
 import threading
 import json
 import struct
+import time
+import functools
+import signal
+import cProfile
+import pstats
+import io
+import os
 import sys
+from abc import ABC, abstractmethod
+
+try:
+    import fcntl
+except ImportError:  # Windows 上没有 fcntl，仅依赖进程内锁
+    fcntl = None
 
 SERVER_CONFIG = {
     "return_ip": None,  # 如果在内网，无需获取公网IP
@@ -14,15 +27,272 @@ SERVER_CONFIG = {
     "max_connections": 100,
     "min_port": 1024,
     "max_port": 65535,
+    "profile": False,  # 开启后可通过 SIGUSR1/SIGUSR2 剖析
+    "profile_window": 30,  # cProfile 窗口秒数
+    "cluster": False,  # 多节点集群模式，节点间共享隧道注册表
+    "node_addr": None,  # 其他节点访问本节点控制端口的地址，如 "10.0.0.1:3147"
+    "cluster_registry": "gout_cluster.json",  # 共享注册表文件路径
+    "cluster_poll_interval": 2,  # 同步注册表的间隔秒数
+    "cluster_ttl": 10,  # 超过该秒数未刷新的隧道视为失效
+    "cluster_pool_size": 4,  # 每个节点保持的空闲转发连接数
+    "cluster_timeout": 5,  # 节点间建立连接和转发握手的超时秒数
 }
 
+LOG_NAME = "gout_server"
+
 
 def log(msg):
     """统一日志打印，带时间"""
     now = datetime.datetime.now()
     timestamp = now.strftime("%Y_%m_%d-%H:%M.") + f"{now.microsecond // 100:04d}"
     # 解释：microsecond//100得到前4位毫秒精度
-    print(f"[gout_server {timestamp}] {msg}")
+    print(f"[{LOG_NAME} {timestamp}] {msg}")
+
+
+class ThreadProbe:
+    """单个转发线程的本地统计，避免每个数据块都竞争 Profiler 的全局锁
+
+    begin/end 只由所属线程调用；dump 和窗口结束时通过 flush 合并到 Profiler
+    """
+
+    def __init__(self, profiler, label: str):
+        self.profiler = profiler
+        self.label = label
+        self.lock = threading.Lock()
+        self.probes = {}  # 尚未合并的探针统计
+        self.cpu = 0.0  # 尚未合并的线程 CPU 秒数
+        self.last_cpu = time.thread_time()
+        self.window_id = 0  # self.profile 所属的剖析窗口
+        self.profile = None
+        self.active = None  # begin/end 之间处于启用状态的 profile
+
+    def begin(self) -> int:
+        """开始一次计时；按线程剖析时在窗口内启用本线程的 cProfile"""
+        window_id = self.profiler.window_id
+        with self.lock:
+            if not window_id:
+                self.profile = None
+            elif self.profiler.per_thread and self.window_id != window_id:
+                self.window_id = window_id
+                self.profile = cProfile.Profile()
+            self.active = self.profile
+        if self.active is not None:
+            self.active.enable()
+        return time.perf_counter_ns()
+
+    def end(self, name: str, start: int):
+        elapsed = time.perf_counter_ns() - start
+        if self.active is not None:
+            self.active.disable()
+        now = time.thread_time()
+        with self.lock:
+            self.active = None
+            add_probe(self.probes, name, elapsed)
+            self.cpu += now - self.last_cpu
+            self.last_cpu = now
+
+    def record(self, name: str, elapsed_ns: int):
+        with self.lock:
+            add_probe(self.probes, name, elapsed_ns)
+
+    def flush(self):
+        with self.lock:
+            probes, self.probes = self.probes, {}
+            cpu, self.cpu = self.cpu, 0.0
+        self.profiler.merge(self.label, probes, cpu)
+
+    def take_profile(self, window_id: int):
+        """取走属于该窗口且当前未启用的 profile"""
+        with self.lock:
+            if self.window_id != window_id or self.active is not None:
+                return None
+            profile, self.profile = self.profile, None
+            return profile
+
+
+def add_probe(probes: dict, name: str, elapsed_ns: int):
+    """累加一次探针耗时：[调用次数, 总耗时 ns, 最大耗时 ns]"""
+    stat = probes.setdefault(name, [0, 0, 0])
+    stat[0] += 1
+    stat[1] += elapsed_ns
+    stat[2] = max(stat[2], elapsed_ns)
+
+
+class Profiler:
+    """可选的性能剖析：cProfile 时间窗口、热路径耗时探针、按隧道统计 CPU"""
+
+    def __init__(self, enabled: bool = False, window: int = 30):
+        self.enabled = enabled
+        self.window = window
+        self.lock = threading.Lock()
+        self.probes = {}  # 探针名 -> [调用次数, 总耗时 ns, 最大耗时 ns]
+        self.tunnel_cpu = {}  # 隧道标签 -> 线程 CPU 秒数
+        self.threads = set()  # 活动的 ThreadProbe
+        self.finished = []  # 窗口内已结束线程留下的 profile
+        self.local = threading.local()
+        self.profile = None
+        self.timer = None
+        self.window_id = 0  # 当前剖析窗口编号，0 表示未开启
+        self.windows = 0
+        # Python 3.12 起 cProfile 基于 sys.monitoring，一个 Profile 即可覆盖所有线程；
+        # 更早的版本由各转发线程在窗口内启用自己的 Profile，结束时合并
+        self.per_thread = sys.version_info < (3, 12)
+
+    def timed(self, name: str):
+        """装饰器：记录函数调用次数和耗时，未开启剖析时原样返回函数"""
+
+        def decorator(fn):
+            if not self.enabled:
+                return fn
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter_ns()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    elapsed = time.perf_counter_ns() - start
+                    probe = getattr(self.local, "probe", None)
+                    if probe is None:
+                        self.record(name, elapsed)
+                    else:
+                        probe.record(name, elapsed)
+
+            return wrapper
+
+        return decorator
+
+    def thread_probe(self, label: str) -> ThreadProbe:
+        """为当前转发线程创建本地统计，未开启剖析时返回 None"""
+        if not self.enabled:
+            return None
+        probe = ThreadProbe(self, label)
+        self.local.probe = probe
+        with self.lock:
+            self.threads.add(probe)
+        return probe
+
+    def release(self, probe: ThreadProbe):
+        """转发线程结束时合并其统计，并把本窗口的 profile 留给 stop()"""
+        probe.flush()
+        profile = probe.take_profile(probe.window_id)
+        with self.lock:
+            self.threads.discard(probe)
+            if profile is not None and probe.window_id == self.window_id:
+                self.finished.append(profile)
+        if getattr(self.local, "probe", None) is probe:
+            self.local.probe = None
+
+    def record(self, name: str, elapsed_ns: int):
+        with self.lock:
+            add_probe(self.probes, name, elapsed_ns)
+
+    def account(self, label: str, cpu: float):
+        """累计某个隧道消耗的线程 CPU 时间"""
+        with self.lock:
+            self.tunnel_cpu[label] = self.tunnel_cpu.get(label, 0.0) + cpu
+
+    def merge(self, label: str, probes: dict, cpu: float):
+        with self.lock:
+            for name, (count, total_ns, max_ns) in probes.items():
+                stat = self.probes.setdefault(name, [0, 0, 0])
+                stat[0] += count
+                stat[1] += total_ns
+                stat[2] = max(stat[2], max_ns)
+            if cpu:
+                self.tunnel_cpu[label] = self.tunnel_cpu.get(label, 0.0) + cpu
+
+    def flush_threads(self):
+        with self.lock:
+            probes = list(self.threads)
+        for probe in probes:
+            probe.flush()
+
+    def toggle(self):
+        """开始一个剖析窗口；窗口进行中再次调用则提前结束并输出结果"""
+        self.flush_threads()  # 窗口开始前的统计不计入本窗口
+        with self.lock:
+            running = self.timer is not None
+            if not running:
+                self.probes = {}
+                self.tunnel_cpu = {}
+                self.windows += 1
+                self.window_id = self.windows
+                self.finished = []
+                if not self.per_thread:
+                    self.profile = cProfile.Profile()
+                    self.profile.enable()
+                self.timer = threading.Timer(self.window, self.stop)
+                self.timer.daemon = True
+                self.timer.start()
+        if running:
+            self.stop()
+            return
+        log(f"profiling started for {self.window}s")
+
+    def stop(self):
+        with self.lock:
+            if self.timer is None:
+                return
+            self.timer.cancel()
+            self.timer = None
+            window_id, self.window_id = self.window_id, 0
+            profile, self.profile = self.profile, None
+            threads = list(self.threads)
+            profiles, self.finished = self.finished, []
+        if profile is not None:
+            profile.disable()
+            profiles.append(profile)
+        for probe in threads:
+            # 窗口结束时正在发送数据的线程，其本窗口的 profile 会被丢弃
+            thread_profile = probe.take_profile(window_id)
+            if thread_profile is not None:
+                profiles.append(thread_profile)
+        if profiles:
+            now = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+            path = f"{LOG_NAME}-{os.getpid()}-{now}.prof"
+            out = io.StringIO()
+            stats = pstats.Stats(profiles[0], stream=out)
+            for thread_profile in profiles[1:]:
+                stats.add(thread_profile)
+            stats.dump_stats(path)
+            stats.sort_stats("cumulative").print_stats(20)
+            log(f"profile saved to {path}\n{out.getvalue()}")
+        else:
+            log("no forwarding activity profiled in this window")
+        self.dump()
+
+    def dump(self):
+        """打印探针耗时和各隧道 CPU 占用"""
+        self.flush_threads()
+        with self.lock:
+            probes = dict(self.probes)
+            tunnel_cpu = dict(self.tunnel_cpu)
+        for name, (count, total_ns, max_ns) in sorted(probes.items()):
+            log(
+                f"probe {name}: calls={count} total={total_ns / 1e6:.2f}ms "
+                f"avg={total_ns / count / 1e3:.1f}us max={max_ns / 1e3:.1f}us"
+            )
+        for label, cpu in sorted(tunnel_cpu.items(), key=lambda x: -x[1]):
+            log(f"tunnel {label}: cpu={cpu:.3f}s")
+
+    def install_signals(self):
+        """SIGUSR1 开关剖析窗口，SIGUSR2 立即打印统计（需在主线程调用）"""
+        if not self.enabled or not hasattr(signal, "SIGUSR1"):
+            return
+        # 在信号处理函数中另起线程，避免与持有锁的主线程死锁
+        signal.signal(
+            signal.SIGUSR1,
+            lambda *_: threading.Thread(target=self.toggle, daemon=True).start(),
+        )
+        signal.signal(
+            signal.SIGUSR2,
+            lambda *_: threading.Thread(target=self.dump, daemon=True).start(),
+        )
+        log(f"profiling hooks ready: kill -USR1 {os.getpid()} to profile")
+
+
+PROFILER = Profiler(SERVER_CONFIG["profile"], SERVER_CONFIG["profile_window"])
 
 
 def get_public_ip() -> str:
@@ -62,36 +332,311 @@ def get_free_port(min_port: int, max_port: int) -> int:
     raise RuntimeError("Failed to get free port in range")
 
 
+class TunnelRegistry(ABC):
+    """集群隧道注册表接口：公网端口 -> 持有控制连接的节点地址
+
+    超过 ttl 秒未刷新的条目视为失效，tunnels() 不再返回，refresh() 时清除
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+
+    @abstractmethod
+    def register(self, port: int, node_addr: str):
+        """登记本节点新建的隧道"""
+
+    @abstractmethod
+    def unregister(self, port: int, node_addr: str):
+        """移除本节点关闭的隧道"""
+
+    @abstractmethod
+    def refresh(self, ports: list, node_addr: str):
+        """批量刷新本节点的全部隧道，并清除本节点已关闭的隧道和过期条目"""
+
+    @abstractmethod
+    def set_unavailable(self, port: int, node_addr: str, unavailable: bool):
+        """登记/撤销某节点无法监听该隧道端口，供所属节点查看"""
+
+    @abstractmethod
+    def tunnels(self) -> dict:
+        """返回未过期的 {port: {"addr": 节点地址, "updated": 刷新时间戳,
+        "unavailable": [无法监听该端口的节点地址]}}"""
+
+    @staticmethod
+    def _new_entry(node_addr: str) -> dict:
+        return {"addr": node_addr, "updated": time.time(), "unavailable": []}
+
+    def _refresh_entries(self, entries: dict, ports: list, node_addr: str):
+        now = time.time()
+        for port, entry in list(entries.items()):
+            stale = now - entry["updated"] >= self.ttl
+            if stale or (entry["addr"] == node_addr and port not in ports):
+                del entries[port]
+        for port in ports:
+            entry = entries.get(port)
+            if entry is None or entry["addr"] != node_addr:
+                entry = entries[port] = self._new_entry(node_addr)
+            entry["updated"] = now
+
+    @staticmethod
+    def _set_unavailable_entry(
+        entries: dict, port: int, node_addr: str, unavailable: bool
+    ):
+        entry = entries.get(port)
+        if entry is None:
+            return
+        nodes = set(entry.get("unavailable", []))
+        if unavailable:
+            nodes.add(node_addr)
+        else:
+            nodes.discard(node_addr)
+        entry["unavailable"] = sorted(nodes)
+
+    def _live_entries(self, entries: dict) -> dict:
+        now = time.time()
+        return {
+            port: dict(entry, unavailable=list(entry.get("unavailable", [])))
+            for port, entry in entries.items()
+            if now - entry["updated"] < self.ttl
+        }
+
+
+class MemoryRegistry(TunnelRegistry):
+    """进程内注册表，用于在同一进程中测试多个节点"""
+
+    def __init__(self, ttl: float):
+        super().__init__(ttl)
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def register(self, port: int, node_addr: str):
+        with self.lock:
+            self.entries[port] = self._new_entry(node_addr)
+
+    def unregister(self, port: int, node_addr: str):
+        with self.lock:
+            if self.entries.get(port, {}).get("addr") == node_addr:
+                del self.entries[port]
+
+    def refresh(self, ports: list, node_addr: str):
+        with self.lock:
+            self._refresh_entries(self.entries, ports, node_addr)
+
+    def set_unavailable(self, port: int, node_addr: str, unavailable: bool):
+        with self.lock:
+            self._set_unavailable_entry(self.entries, port, node_addr, unavailable)
+
+    def tunnels(self) -> dict:
+        with self.lock:
+            return self._live_entries(self.entries)
+
+
+class FileRegistry(TunnelRegistry):
+    """基于本地 JSON 文件的注册表，适用于同机或共享文件系统上的节点"""
+
+    def __init__(self, path: str, ttl: float):
+        super().__init__(ttl)
+        self.path = path
+        self.lock = threading.Lock()
+
+    def _update(self, fn):
+        """加锁读取注册表，调用 fn 修改后原子写回"""
+        with self.lock, open(self.path + ".lock", "w") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            entries = self._load()
+            fn(entries)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump({str(port): entry for port, entry in entries.items()}, f)
+            os.replace(tmp, self.path)
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path) as f:
+                return {int(port): entry for port, entry in json.load(f).items()}
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def register(self, port: int, node_addr: str):
+        def fn(entries):
+            entries[port] = self._new_entry(node_addr)
+
+        self._update(fn)
+
+    def unregister(self, port: int, node_addr: str):
+        def fn(entries):
+            if entries.get(port, {}).get("addr") == node_addr:
+                del entries[port]
+
+        self._update(fn)
+
+    def refresh(self, ports: list, node_addr: str):
+        self._update(lambda entries: self._refresh_entries(entries, ports, node_addr))
+
+    def set_unavailable(self, port: int, node_addr: str, unavailable: bool):
+        self._update(
+            lambda entries: self._set_unavailable_entry(
+                entries, port, node_addr, unavailable
+            )
+        )
+
+    def tunnels(self) -> dict:
+        return self._live_entries(self._load())
+
+
+def close_socket(sock: socket.socket):
+    """关闭 socket 并唤醒阻塞在 accept/recv 上的线程，忽略所有错误"""
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+    sock.close()
+
+
+def connect_node(node_addr: str) -> socket.socket:
+    host, port = node_addr.rsplit(":", 1)
+    return socket.create_connection(
+        (host, int(port)), timeout=SERVER_CONFIG["cluster_timeout"]
+    )
+
+
+def is_idle_conn_alive(conn: socket.socket) -> bool:
+    """空闲连接不应可读：读到 EOF 说明对端已关闭，读到数据说明状态异常"""
+    try:
+        conn.setblocking(False)
+        conn.recv(1, socket.MSG_PEEK)
+    except BlockingIOError:
+        return True
+    except OSError:
+        pass
+    return False
+
+
+class RelayPool:
+    """节点间连接池：预先建立到其他节点的空闲连接，转发时直接取用"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.lock = threading.Lock()
+        self.idle = {}  # 节点地址 -> 空闲 socket 列表
+        self.filling = set()  # 正在补充连接的节点地址
+
+    def get(self, node_addr: str) -> socket.socket:
+        """取出一个到该节点的连接，超时为 cluster_timeout，由调用方在握手后清除"""
+        conn = None
+        while conn is None:
+            with self.lock:
+                conns = self.idle.setdefault(node_addr, [])
+                if not conns:
+                    break
+                conn = conns.pop()
+            # 已失效的空闲连接直接丢弃
+            if not is_idle_conn_alive(conn):
+                conn.close()
+                conn = None
+        with self.lock:
+            start_fill = node_addr not in self.filling
+            self.filling.add(node_addr)
+        if start_fill:
+            threading.Thread(target=self.fill, args=(node_addr,), daemon=True).start()
+        if conn is None:
+            conn = connect_node(node_addr)
+        conn.settimeout(SERVER_CONFIG["cluster_timeout"])
+        return conn
+
+    def fill(self, node_addr: str):
+        """补充空闲连接到 size 个，每个节点同一时间只有一个补充线程"""
+        with self.lock:
+            conns = self.idle.setdefault(node_addr, [])
+        while True:
+            with self.lock:
+                # 连接池已满，或该节点已被 close() 移除
+                if len(conns) >= self.size or self.idle.get(node_addr) is not conns:
+                    self.filling.discard(node_addr)
+                    return
+            try:
+                conn = connect_node(node_addr)
+            except Exception as e:
+                log(f"relay pool connect {node_addr} error: {e}")
+                with self.lock:
+                    self.filling.discard(node_addr)
+                return
+            with self.lock:
+                if self.idle.get(node_addr) is conns:
+                    conns.append(conn)
+                    continue
+            conn.close()
+
+    def close(self, node_addr: str):
+        with self.lock:
+            for conn in self.idle.pop(node_addr, []):
+                conn.close()
+
+
 class ForwardServer:
-    def __init__(self, host: str, port: int, max_connections: int = 100):
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        max_connections: int = 100,
+        registry: TunnelRegistry = None,
+        node_addr: str = None,
+    ):
+        self.host = host
         self.srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.srv.bind((host, port))
         self.srv.listen(max_connections)
 
-    def start_tunnel(self, control_conn: socket.socket, client_config: dict):
-        def _fwd(src: socket.socket, dst: socket.socket):
-            """TCP 双向转发，不使用事件"""
-            try:
-                while True:
-                    data = src.recv(4096)
-                    if not data:
-                        break
+        self.lock = threading.Lock()
+        self.tunnels = {}  # 本节点隧道 port -> (外部连接处理函数, 控制连接)
+        self.relays = {}  # 远程隧道 port -> (节点地址, 监听 socket)
+        self.relay_failures = {}  # 监听失败的 port -> (节点地址, 重试时间, 间隔)
+        self.unavailable = {}  # 本节点隧道 port -> 已报告无法监听的节点集合
+        self.closed = threading.Event()
+        self.registry = registry
+        if self.registry is None and SERVER_CONFIG["cluster"]:
+            self.registry = FileRegistry(
+                SERVER_CONFIG["cluster_registry"], SERVER_CONFIG["cluster_ttl"]
+            )
+        if self.registry is not None:
+            self.node_addr = node_addr or SERVER_CONFIG["node_addr"]
+            if not self.node_addr:
+                raise RuntimeError("node_addr is required in cluster mode")
+            self.pool = RelayPool(SERVER_CONFIG["cluster_pool_size"])
+
+    def _fwd(self, src: socket.socket, dst: socket.socket, label: str):
+        """TCP 双向转发，不使用事件"""
+        probe = PROFILER.thread_probe(label)
+        try:
+            while True:
+                data = src.recv(4096)
+                if not data:
+                    break
+                if probe is None:
                     dst.sendall(data)
-            except Exception:
-                pass  # 连接关闭是正常行为，不需要记录
-            finally:
-                # 安全地关闭 socket，忽略所有错误
-                for sock in [src, dst]:
-                    try:
-                        sock.shutdown(socket.SHUT_RDWR)
-                    except:
-                        pass
-                    try:
-                        sock.close()
-                    except:
-                        pass
+                    continue
+                start = probe.begin()
+                dst.sendall(data)
+                probe.end("tcp.send", start)
+        except Exception:
+            pass  # 连接关闭是正常行为，不需要记录
+        finally:
+            if probe is not None:
+                PROFILER.release(probe)
+            # 安全地关闭 socket，忽略所有错误
+            for sock in [src, dst]:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except:
+                    pass
+                try:
+                    sock.close()
+                except:
+                    pass
 
+    def start_tunnel(self, control_conn: socket.socket, client_config: dict):
         def handle_external_connection(external_conn: socket.socket):
             """处理每个外部连接：通知客户端并等待数据连接"""
             try:
@@ -103,10 +648,14 @@ class ForwardServer:
 
                 # 双向转发
                 t1 = threading.Thread(
-                    target=_fwd, args=(external_conn, data_conn), daemon=True
+                    target=self._fwd,
+                    args=(external_conn, data_conn, label),
+                    daemon=True,
                 )
                 t2 = threading.Thread(
-                    target=_fwd, args=(data_conn, external_conn), daemon=True
+                    target=self._fwd,
+                    args=(data_conn, external_conn, label),
+                    daemon=True,
                 )
                 t1.start()
                 t2.start()
@@ -114,19 +663,37 @@ class ForwardServer:
                 log(f"Handle external connection error: {e}")
                 external_conn.close()
 
+        # 隧道建立耗时：分配端口、监听、登记注册表，不含阻塞等待
+        setup_start = time.perf_counter_ns()
+
+        # 集群中端口需在所有节点上可用，避开其他节点正在使用的端口
+        cluster_ports = self.registry.tunnels() if self.registry is not None else {}
+        for _ in range(10):
+            free_port = get_free_port(
+                SERVER_CONFIG["min_port"], SERVER_CONFIG["max_port"]
+            )
+            if free_port not in cluster_ports:
+                break
+        else:
+            raise RuntimeError("Failed to get free port unused in cluster")
+
         # 创建数据连接监听端口
         data_srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         data_srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        data_srv.bind(("0.0.0.0", 0))
+        data_srv.bind((self.host, 0))
         data_srv.listen(100)
         data_port = data_srv.getsockname()[1]
 
         # 创建公网访问端口
         target_srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         target_srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        free_port = get_free_port(SERVER_CONFIG["min_port"], SERVER_CONFIG["max_port"])
-        target_srv.bind(("0.0.0.0", free_port))
+        target_srv.bind((self.host, free_port))
         target_srv.listen(100)
+        label = f"tcp:{free_port}"
+        with self.lock:
+            self.tunnels[free_port] = (handle_external_connection, control_conn)
+        if self.registry is not None:
+            self.registry.register(free_port, self.node_addr)
         log(
             f"new tunnel {PUBLIC_IP}:{free_port} -> {control_conn.getpeername()[0]}:{client_config['port']}"
         )
@@ -134,6 +701,24 @@ class ForwardServer:
         # 返回配置给客户端
         response = {"ip": PUBLIC_IP, "port": free_port, "data_port": data_port}
         control_conn.sendall(json.dumps(response).encode())
+        if PROFILER.enabled:
+            PROFILER.record("tcp.setup", time.perf_counter_ns() - setup_start)
+
+        # TCP 模式下客户端不会在控制连接上发送数据，读到 EOF 即客户端已断开
+        closed = threading.Event()
+
+        def watch_control_conn():
+            try:
+                while control_conn.recv(1024):
+                    pass
+            except Exception:
+                pass
+            closed.set()
+            log(f"tunnel {PUBLIC_IP}:{free_port} closed")
+            for sock in [target_srv, data_srv, control_conn]:
+                close_socket(sock)
+
+        threading.Thread(target=watch_control_conn, daemon=True).start()
 
         # 持续接受外部连接
         while True:
@@ -145,12 +730,19 @@ class ForwardServer:
                     daemon=True,
                 ).start()
             except Exception as e:
-                log(f"Accept external connection error: {e}")
+                if not closed.is_set():
+                    log(f"Accept external connection error: {e}")
                 break
 
+        with self.lock:
+            self.tunnels.pop(free_port, None)
+        if self.registry is not None:
+            self.registry.unregister(free_port, self.node_addr)
+
     def start_udp_tunnel(self, control_conn: socket.socket, client_config: dict):
         """UDP 转发：服务器接收 UDP，通过 TCP 控制连接传输给客户端"""
 
+        @PROFILER.timed("udp.encode")
         def encode_udp_packet(addr: tuple, data: bytes) -> bytes:
             """编码 UDP 包：4字节长度 + IP + 端口 + 数据"""
             ip_bytes = socket.inet_aton(addr[0])
@@ -158,6 +750,7 @@ class ForwardServer:
             data_len = struct.pack("!I", len(data))
             return data_len + ip_bytes + port_bytes + data
 
+        @PROFILER.timed("udp.decode")
         def decode_udp_packet(packet: bytes) -> tuple:
             """解码 UDP 包：返回 (addr, data)"""
             data_len = struct.unpack("!I", packet[:4])[0]
@@ -166,11 +759,14 @@ class ForwardServer:
             data = packet[10 : 10 + data_len]
             return (ip, port), data
 
+        setup_start = time.perf_counter_ns()
+
         # 创建公网 UDP socket
         udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         udp_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         free_port = get_free_port(SERVER_CONFIG["min_port"], SERVER_CONFIG["max_port"])
-        udp_sock.bind(("0.0.0.0", free_port))
+        udp_sock.bind((self.host, free_port))
+        label = f"udp:{free_port}"
 
         log(
             f"new UDP tunnel {PUBLIC_IP}:{free_port} -> {control_conn.getpeername()[0]}:{client_config['port']}"
@@ -179,27 +775,37 @@ class ForwardServer:
         # 返回配置给客户端
         response = {"ip": PUBLIC_IP, "port": free_port, "protocol": "udp"}
         control_conn.sendall(json.dumps(response).encode())
+        if PROFILER.enabled:
+            PROFILER.record("udp.setup", time.perf_counter_ns() - setup_start)
 
         # 从外部接收 UDP 并发送给客户端
         def udp_to_client():
+            probe = PROFILER.thread_probe(label)
             while True:
                 try:
                     data, addr = udp_sock.recvfrom(65535)
+                    start = probe.begin() if probe else 0
                     packet = encode_udp_packet(addr, data)
                     # 发送给客户端：先发送包长度，再发送数据
                     control_conn.sendall(struct.pack("!I", len(packet)) + packet)
+                    if probe:
+                        probe.end("udp.to_client", start)
                 except Exception as e:
                     log(f"UDP to client error: {e}")
                     break
+            if probe:
+                PROFILER.release(probe)
 
         # 从客户端接收并发送到外部 UDP
         def client_to_udp():
+            probe = PROFILER.thread_probe(label)
             buffer = b""
             while True:
                 try:
                     data = control_conn.recv(4096)
                     if not data:
                         break
+                    start = probe.begin() if probe else 0
                     buffer += data
 
                     # 处理完整的包
@@ -213,9 +819,14 @@ class ForwardServer:
 
                         addr, udp_data = decode_udp_packet(packet)
                         udp_sock.sendto(udp_data, addr)
+
+                    if probe:
+                        probe.end("udp.from_client", start)
                 except Exception as e:
                     log(f"Client to UDP error: {e}")
                     break
+            if probe:
+                PROFILER.release(probe)
 
         t1 = threading.Thread(target=udp_to_client, daemon=True)
         t2 = threading.Thread(target=client_to_udp, daemon=True)
@@ -224,21 +835,37 @@ class ForwardServer:
         t1.join()
         t2.join()
 
+    def handshake(self, raw: bytes) -> dict:
+        """解析并校验客户端配置，密码错误返回 None"""
+        data = json.loads(raw.decode())
+        if data["password"] != SERVER_CONFIG["verify_password"]:
+            return None
+        # 其他节点转发过来的外部连接
+        if "relay" in data:
+            return {"relay": data["relay"]}
+        return {
+            "protocol": data["protocol"],
+            "port": data["port"],
+            "password": data["password"],
+        }
+
     def handle_client(self, client: socket.socket):
-        data = json.loads(client.recv(1024).decode())
         try:
-            client_config = {
-                "protocol": data["protocol"],
-                "port": data["port"],
-                "password": data["password"],
-            }
-            if client_config["password"] != SERVER_CONFIG["verify_password"]:
+            raw = client.recv(1024)
+            # 其他节点关闭未使用的空闲连接
+            if not raw:
+                client.close()
+                return
+            client_config = self.handshake(raw)
+            if client_config is None:
                 log(f"invalid password from {client.getpeername()}")
                 client.close()
                 return
 
             # 根据协议类型选择不同的处理方式
-            if client_config["protocol"] == "udp":
+            if "relay" in client_config:
+                self.accept_relay(client, client_config["relay"])
+            elif client_config["protocol"] == "udp":
                 self.start_udp_tunnel(client, client_config)
             else:
                 self.start_tunnel(client, client_config)
@@ -247,16 +874,174 @@ class ForwardServer:
             client.close()
             return
 
+    def accept_relay(self, relay_conn: socket.socket, port: int):
+        """作为隧道所属节点，接收其他节点转发过来的外部连接"""
+        with self.lock:
+            handler, _ = self.tunnels.get(port, (None, None))
+        if handler is None:
+            relay_conn.sendall(b"NO_TUNNEL\n")
+            relay_conn.close()
+            return
+        relay_conn.sendall(b"OK\n")
+        handler(relay_conn)
+
+    def relay_external(self, external_conn: socket.socket, port: int, node_addr: str):
+        """外部连接落在非所属节点时，经节点间连接转发给所属节点"""
+        peer_conn = None
+        try:
+            peer_conn = self.pool.get(node_addr)
+            header = {"relay": port, "password": SERVER_CONFIG["verify_password"]}
+            peer_conn.sendall(json.dumps(header).encode())
+            # 逐字节读取应答行，之后可能紧跟本地服务主动发送的数据
+            reply = b""
+            while not reply.endswith(b"\n"):
+                byte = peer_conn.recv(1)
+                if not byte:
+                    break
+                reply += byte
+            if reply != b"OK\n":
+                raise RuntimeError(f"relay refused: {reply!r}")
+            peer_conn.settimeout(None)
+
+            label = f"relay:{port}"
+            t1 = threading.Thread(
+                target=self._fwd, args=(external_conn, peer_conn, label), daemon=True
+            )
+            t2 = threading.Thread(
+                target=self._fwd, args=(peer_conn, external_conn, label), daemon=True
+            )
+            t1.start()
+            t2.start()
+        except Exception as e:
+            log(f"Relay to {node_addr} error: {e}")
+            external_conn.close()
+            if peer_conn is not None:
+                peer_conn.close()
+
+    def open_relay(self, port: int, node_addr: str):
+        """在本节点监听远程隧道的公网端口"""
+        relay_srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        relay_srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            relay_srv.bind((self.host, port))
+            relay_srv.listen(100)
+        except Exception as e:
+            log(f"relay port {port} -> {node_addr} unavailable: {e}")
+            relay_srv.close()
+            return None
+        log(f"new relay {PUBLIC_IP}:{port} -> node {node_addr}")
+
+        def accept_loop():
+            while True:
+                try:
+                    external_conn, _ = relay_srv.accept()
+                except Exception:
+                    break  # 远程隧道失效时监听 socket 被关闭
+                threading.Thread(
+                    target=self.relay_external,
+                    args=(external_conn, port, node_addr),
+                    daemon=True,
+                ).start()
+
+        threading.Thread(target=accept_loop, daemon=True).start()
+        return relay_srv
+
+    def sync_relays(self, remote: dict):
+        """为其他节点的隧道开启/关闭转发端口，监听失败时退避重试并登记到注册表"""
+        for port, (node_addr, relay_srv) in list(self.relays.items()):
+            if remote.get(port) != node_addr:
+                log(f"relay {port} -> node {node_addr} closed")
+                close_socket(relay_srv)
+                del self.relays[port]
+                if node_addr not in remote.values():
+                    self.pool.close(node_addr)
+        for port in list(self.relay_failures):
+            if port not in remote:
+                del self.relay_failures[port]
+
+        now = time.time()
+        for port, node_addr in remote.items():
+            if port in self.relays:
+                continue
+            failure = self.relay_failures.get(port)
+            if failure is not None and failure[0] != node_addr:
+                failure = None  # 隧道换了所属节点，重新开始计算退避
+            if failure is not None and now < failure[1]:
+                continue
+            relay_srv = self.open_relay(port, node_addr)
+            if relay_srv is None:
+                delay = SERVER_CONFIG["cluster_poll_interval"]
+                if failure is not None:
+                    delay = min(failure[2] * 2, 60)
+                self.relay_failures[port] = (node_addr, now + delay, delay)
+                self.registry.set_unavailable(port, self.node_addr, True)
+                continue
+            self.relays[port] = (node_addr, relay_srv)
+            if failure is not None:
+                del self.relay_failures[port]
+                self.registry.set_unavailable(port, self.node_addr, False)
+
+    def check_unavailable(self, tunnels: dict, local_ports: list):
+        """提示本节点的隧道在哪些节点上无法访问"""
+        for port in list(self.unavailable):
+            if port not in local_ports:
+                del self.unavailable[port]
+        for port in local_ports:
+            nodes = set(tunnels.get(port, {}).get("unavailable", []))
+            for node_addr in sorted(nodes - self.unavailable.get(port, set())):
+                log(f"tunnel {port} unreachable via node {node_addr}: port busy there")
+            self.unavailable[port] = nodes
+
+    def sync_cluster(self):
+        """定期刷新本节点隧道，并同步其他节点隧道的转发端口"""
+        while not self.closed.is_set():
+            try:
+                with self.lock:
+                    local_ports = list(self.tunnels)
+                self.registry.refresh(local_ports, self.node_addr)
+
+                tunnels = self.registry.tunnels()
+                remote = {
+                    port: entry["addr"]
+                    for port, entry in tunnels.items()
+                    if entry["addr"] != self.node_addr and port not in local_ports
+                }
+                self.sync_relays(remote)
+                self.check_unavailable(tunnels, local_ports)
+            except Exception as e:
+                log(f"cluster sync error: {e}")
+            self.closed.wait(SERVER_CONFIG["cluster_poll_interval"])
+
+    def close(self):
+        """停止节点：关闭控制端口、本节点的 TCP 隧道和转发端口"""
+        self.closed.set()
+        close_socket(self.srv)
+        with self.lock:
+            control_conns = [conn for _, conn in self.tunnels.values()]
+        # 关闭控制连接后由 watch_control_conn 关闭隧道并注销
+        for conn in control_conns:
+            close_socket(conn)
+        if self.registry is not None:
+            for _, relay_srv in list(self.relays.values()):
+                close_socket(relay_srv)
+            for node_addr in list(self.pool.idle):
+                self.pool.close(node_addr)
+
     def run(self):
         log(f"public IP: {PUBLIC_IP}")
         log(f"listening {SERVER_CONFIG['host']}:{SERVER_CONFIG['port']}")
+        if self.registry is not None:
+            log(f"cluster node {self.node_addr}")
+            threading.Thread(target=self.sync_cluster, daemon=True).start()
 
-        while True:
+        while not self.closed.is_set():
             try:
                 client, addr = self.srv.accept()
                 log(f"new connection from {addr}")
                 threading.Thread(target=self.handle_client, args=(client,)).start()
             except Exception as e:
+                if self.closed.is_set():
+                    break
                 log(f"accept error: {e}")
                 continue
 
@@ -283,6 +1068,27 @@ CONFIGURATION:
     - max_connections: Maximum concurrent connections
     - min_port: Minimum port for dynamic allocation (default: 1024)
     - max_port: Maximum port for dynamic allocation (default: 65535)
+    - profile: Enable profiling hooks (default: False)
+    - profile_window: cProfile window in seconds (default: 30)
+    - cluster: Share the tunnel registry with other nodes (default: False)
+    - node_addr: Address other nodes use to reach this node, e.g. 10.0.0.1:3147
+    - cluster_registry: Shared registry file (default: gout_cluster.json)
+    - cluster_poll_interval: Registry sync interval in seconds (default: 2)
+    - cluster_ttl: Seconds before an unrefreshed tunnel is dropped (default: 10)
+    - cluster_pool_size: Idle inter-node connections per node (default: 4)
+    - cluster_timeout: Inter-node connect/relay handshake timeout (default: 5)
+
+CLUSTER MODE:
+    Several servers can run behind one DNS name. Each node publishes its
+    TCP tunnels to the shared registry and listens on the public ports of
+    tunnels owned by other nodes. External connections that land on a node
+    without the control connection are relayed to the owning node over a
+    pooled inter-node connection. UDP tunnels stay local to their node.
+
+PROFILING:
+    With profile enabled, send signals to the server process:
+    - kill -USR1 <pid>   Start a cProfile window (send again to stop early)
+    - kill -USR2 <pid>   Print probe timings and per-tunnel CPU now
 
 FEATURES:
     - TCP port forwarding with multiple concurrent connections
@@ -337,6 +1143,8 @@ if __name__ == "__main__":
     print("=" * 60)
     print()
 
+    PROFILER.install_signals()
+
     try:
         server = ForwardServer(
             SERVER_CONFIG["host"],
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""集群模式测试：注册表、节点间连接池，以及同一进程内共享 MemoryRegistry 的两个节点"""
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import types
+import unittest
+
+# gout_server 导入时会通过 requests 获取公网 IP，测试中固定返回本机地址
+fake_response = types.SimpleNamespace(text="127.0.0.1")
+sys.modules.setdefault(
+    "requests", types.SimpleNamespace(get=lambda url, timeout: fake_response)
+)
+
+import gout_server  # noqa: E402
+
+
+def free_port(host: str) -> int:
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind((host, 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def wait_for(predicate, timeout: float = 5) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def start_echo_server() -> int:
+    srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    srv.bind(("127.0.0.1", 0))
+    srv.listen(10)
+
+    def handle(conn):
+        with conn:
+            while True:
+                data = conn.recv(4096)
+                if not data:
+                    break
+                conn.sendall(data)
+
+    def accept_loop():
+        while True:
+            conn, _ = srv.accept()
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+    return srv.getsockname()[1]
+
+
+def start_client(server_port: int, local_port: int):
+    """最小 TCP 客户端：返回 (控制连接, 分配的公网端口)"""
+    control_conn = socket.create_connection(("127.0.0.1", server_port))
+    config = {
+        "protocol": "tcp",
+        "port": local_port,
+        "password": gout_server.SERVER_CONFIG["verify_password"],
+    }
+    control_conn.sendall(json.dumps(config).encode())
+    response = json.loads(control_conn.recv(1024).decode())
+
+    def fwd(src, dst):
+        try:
+            while True:
+                data = src.recv(4096)
+                if not data:
+                    break
+                dst.sendall(data)
+        except OSError:
+            pass
+        finally:
+            src.close()
+            dst.close()
+
+    def control_loop():
+        try:
+            while control_conn.recv(1024):
+                data_conn = socket.create_connection(
+                    ("127.0.0.1", response["data_port"])
+                )
+                local_conn = socket.create_connection(("127.0.0.1", local_port))
+                for src, dst in [(data_conn, local_conn), (local_conn, data_conn)]:
+                    threading.Thread(target=fwd, args=(src, dst), daemon=True).start()
+        except OSError:
+            pass
+
+    threading.Thread(target=control_loop, daemon=True).start()
+    return control_conn, response["port"]
+
+
+def make_registries(testcase, ttl: float = 5):
+    """返回 [(名称, 注册表工厂)]，FileRegistry 的每个实例共享同一个临时文件"""
+    tmpdir = tempfile.TemporaryDirectory()
+    testcase.addCleanup(tmpdir.cleanup)
+    path = os.path.join(tmpdir.name, "cluster.json")
+    memory = gout_server.MemoryRegistry(ttl)
+    return [
+        ("memory", lambda: memory),
+        ("file", lambda: gout_server.FileRegistry(path, ttl)),
+    ]
+
+
+class RegistryTest(unittest.TestCase):
+    def test_round_trip(self):
+        for name, registry in make_registries(self):
+            with self.subTest(registry=name):
+                registry().register(1001, "node-a")
+                registry().register(2001, "node-b")
+                tunnels = registry().tunnels()
+                self.assertEqual(tunnels.keys(), {1001, 2001})
+                self.assertEqual(tunnels[1001]["addr"], "node-a")
+                self.assertEqual(tunnels[1001]["unavailable"], [])
+
+    def test_unregister_only_by_owner(self):
+        for name, registry in make_registries(self):
+            with self.subTest(registry=name):
+                registry().register(1001, "node-a")
+                registry().unregister(1001, "node-b")
+                self.assertIn(1001, registry().tunnels())
+                registry().unregister(1001, "node-a")
+                self.assertNotIn(1001, registry().tunnels())
+
+    def test_refresh_drops_stale_and_closed_entries(self):
+        for name, registry in make_registries(self, ttl=0.5):
+            with self.subTest(registry=name):
+                registry().refresh([1001, 1002], "node-a")
+                registry().register(2001, "node-b")
+                registry().refresh([1001], "node-a")
+                self.assertEqual(registry().tunnels().keys(), {1001, 2001})
+
+                # node-b 不再刷新，过期后 tunnels() 不返回，下次 refresh 时清除
+                time.sleep(0.6)
+                self.assertEqual(registry().tunnels(), {})
+                registry().refresh([1001], "node-a")
+                self.assertEqual(registry().tunnels().keys(), {1001})
+
+    def test_set_unavailable(self):
+        for name, registry in make_registries(self):
+            with self.subTest(registry=name):
+                registry().register(1001, "node-a")
+                registry().set_unavailable(1001, "node-b", True)
+                registry().refresh([1001], "node-a")
+                self.assertEqual(registry().tunnels()[1001]["unavailable"], ["node-b"])
+                registry().set_unavailable(1001, "node-b", False)
+                self.assertEqual(registry().tunnels()[1001]["unavailable"], [])
+
+    def test_registry_requires_all_methods(self):
+        class PartialRegistry(gout_server.TunnelRegistry):
+            def tunnels(self):
+                return {}
+
+        with self.assertRaises(TypeError):
+            PartialRegistry(ttl=5)
+
+
+class RelayPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.srv.bind(("127.0.0.1", 0))
+        self.srv.listen(50)
+        self.addCleanup(gout_server.close_socket, self.srv)
+        self.accepted = []
+
+        def accept_loop():
+            while True:
+                try:
+                    self.accepted.append(self.srv.accept()[0])
+                except OSError:
+                    break
+
+        threading.Thread(target=accept_loop, daemon=True).start()
+        self.node_addr = "127.0.0.1:%d" % self.srv.getsockname()[1]
+        self.pool = gout_server.RelayPool(3)
+        self.addCleanup(self.pool.close, self.node_addr)
+
+    def idle(self) -> list:
+        with self.pool.lock:
+            return list(self.pool.idle.get(self.node_addr, []))
+
+    def test_get_refills_to_size(self):
+        conn = self.pool.get(self.node_addr)
+        self.addCleanup(conn.close)
+        self.assertEqual(conn.gettimeout(), gout_server.SERVER_CONFIG["cluster_timeout"])
+        self.assertTrue(wait_for(lambda: len(self.idle()) == 3))
+        self.assertTrue(wait_for(lambda: not self.pool.filling))
+        # 同一节点只有一个补充线程，不会超出 size
+        for _ in range(5):
+            self.pool.get(self.node_addr).close()
+        self.assertTrue(wait_for(lambda: not self.pool.filling))
+        self.assertEqual(len(self.idle()), 3)
+
+    def test_get_discards_dead_connections(self):
+        self.pool.get(self.node_addr).close()
+        self.assertTrue(wait_for(lambda: len(self.idle()) == 3))
+        dead = self.idle()
+        # get() 直连的 1 个加上补充的 3 个
+        self.assertTrue(wait_for(lambda: len(self.accepted) == 4))
+        for conn in self.accepted:
+            conn.close()
+
+        conn = self.pool.get(self.node_addr)
+        self.addCleanup(conn.close)
+        self.assertNotIn(conn, dead)
+        self.assertTrue(all(c.fileno() == -1 for c in dead))
+
+    def test_close_drops_idle_connections(self):
+        self.pool.get(self.node_addr).close()
+        self.assertTrue(wait_for(lambda: len(self.idle()) == 3))
+        idle = self.idle()
+        self.pool.close(self.node_addr)
+        self.assertEqual(self.idle(), [])
+        self.assertTrue(all(c.fileno() == -1 for c in idle))
+
+
+class ClusterTest(unittest.TestCase):
+    def setUp(self):
+        # 127.0.0.2 在 macOS 上默认不存在
+        try:
+            free_port("127.0.0.2")
+        except OSError:
+            self.skipTest("loopback alias 127.0.0.2 is not available")
+        gout_server.SERVER_CONFIG["cluster_poll_interval"] = 0.1
+        self.registry = gout_server.MemoryRegistry(ttl=5)
+        self.nodes = []
+        for host in ["127.0.0.1", "127.0.0.2"]:
+            port = free_port(host)
+            node = gout_server.ForwardServer(
+                host, port, registry=self.registry, node_addr=f"{host}:{port}"
+            )
+            threading.Thread(target=node.run, daemon=True).start()
+            self.nodes.append((node, port))
+            self.addCleanup(node.close)
+
+    def test_relay_and_cleanup(self):
+        (owner, owner_port), (relay_node, _) = self.nodes
+        control_conn, tunnel_port = start_client(owner_port, start_echo_server())
+
+        self.assertIn(tunnel_port, self.registry.tunnels())
+        self.assertTrue(wait_for(lambda: tunnel_port in relay_node.relays))
+
+        # 外部连接落在非所属节点，经节点间连接转发
+        conn = socket.create_connection(("127.0.0.2", tunnel_port), timeout=5)
+        conn.sendall(b"ping")
+        self.assertEqual(conn.recv(1024), b"ping")
+        conn.close()
+
+        # 客户端断开后隧道从所属节点、注册表和转发节点上消失
+        control_conn.shutdown(socket.SHUT_RDWR)
+        control_conn.close()
+        self.assertTrue(wait_for(lambda: tunnel_port not in owner.tunnels))
+        self.assertNotIn(tunnel_port, self.registry.tunnels())
+        self.assertTrue(wait_for(lambda: tunnel_port not in relay_node.relays))
+
+    def test_busy_relay_port_is_reported_and_retried(self):
+        relay_node = self.nodes[1][0]
+        # 所属节点不在运行，由测试代为刷新；隧道端口在转发节点上已被占用
+        owner_addr = "127.0.0.1:%d" % free_port("127.0.0.1")
+        blocker = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        blocker.bind(("127.0.0.2", 0))
+        blocker.listen(1)
+        port = blocker.getsockname()[1]
+        self.registry.register(port, owner_addr)
+
+        self.assertTrue(
+            wait_for(
+                lambda: self.registry.tunnels()[port]["unavailable"]
+                == [relay_node.node_addr]
+            )
+        )
+        self.assertNotIn(port, relay_node.relays)
+
+        blocker.close()
+        self.registry.refresh([port], owner_addr)
+        self.assertTrue(wait_for(lambda: port in relay_node.relays))
+        self.assertEqual(self.registry.tunnels()[port]["unavailable"], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
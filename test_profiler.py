@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""剖析功能测试：gout.py 与 gout_server.py 中的 Profiler 保持一致"""
+import contextlib
+import glob
+import io
+import os
+import sys
+import tempfile
+import time
+import types
+import unittest
+
+# gout_server 导入时会通过 requests 获取公网 IP，测试中固定返回本机地址
+fake_response = types.SimpleNamespace(text="127.0.0.1")
+sys.modules.setdefault(
+    "requests", types.SimpleNamespace(get=lambda url, timeout: fake_response)
+)
+
+import gout  # noqa: E402
+import gout_server  # noqa: E402
+
+MODULES = [gout, gout_server]
+
+
+def busy_chunk(probe):
+    start = probe.begin()
+    sum(range(10000))
+    probe.end("tcp.send", start)
+
+
+class ProfilerTest(unittest.TestCase):
+    def setUp(self):
+        # .prof 文件写入临时目录
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(tmpdir.name)
+
+    def test_timed_records_only_when_enabled(self):
+        for module in MODULES:
+            with self.subTest(module=module.__name__):
+
+                def fn():
+                    time.sleep(0.01)
+
+                disabled = module.Profiler(enabled=False)
+                self.assertIs(disabled.timed("probe")(fn), fn)
+
+                profiler = module.Profiler(enabled=True)
+                timed = profiler.timed("probe")(fn)
+                timed()
+                timed()
+                count, total_ns, max_ns = profiler.probes["probe"]
+                self.assertEqual(count, 2)
+                self.assertGreaterEqual(max_ns, 10_000_000)
+                self.assertGreaterEqual(total_ns, 2 * 10_000_000)
+
+    def test_account_and_thread_probe(self):
+        for module in MODULES:
+            with self.subTest(module=module.__name__):
+                profiler = module.Profiler(enabled=True)
+                profiler.account("tcp:1", 0.5)
+                profiler.account("tcp:1", 0.25)
+                self.assertAlmostEqual(profiler.tunnel_cpu["tcp:1"], 0.75)
+
+                self.assertIsNone(module.Profiler().thread_probe("tcp:2"))
+                probe = profiler.thread_probe("tcp:2")
+                busy_chunk(probe)
+                # 线程结束前统计只保存在线程本地
+                self.assertNotIn("tcp.send", profiler.probes)
+                profiler.release(probe)
+                self.assertEqual(profiler.probes["tcp.send"][0], 1)
+                self.assertIn("tcp:2", profiler.tunnel_cpu)
+                self.assertEqual(profiler.threads, set())
+
+    def test_toggle_then_stop_dumps_results(self):
+        for module in MODULES:
+            with self.subTest(module=module.__name__):
+                profiler = module.Profiler(enabled=True, window=60)
+                probe = profiler.thread_probe("tcp:3")
+                out = io.StringIO()
+                with contextlib.redirect_stdout(out):
+                    profiler.toggle()
+                    self.assertIsNotNone(profiler.timer)
+                    busy_chunk(probe)
+                    profiler.stop()
+                profiler.release(probe)
+
+                self.assertIsNone(profiler.timer)
+                self.assertEqual(profiler.window_id, 0)
+                text = out.getvalue()
+                self.assertIn("profile saved to", text)
+                self.assertIn("probe tcp.send: calls=1", text)
+                self.assertIn("tunnel tcp:3", text)
+                self.assertTrue(glob.glob(f"{module.LOG_NAME}-*.prof"))
+
+    def test_stop_keeps_profile_of_finished_thread(self):
+        for module in MODULES:
+            with self.subTest(module=module.__name__):
+                profiler = module.Profiler(enabled=True, window=60)
+                out = io.StringIO()
+                with contextlib.redirect_stdout(out):
+                    profiler.toggle()
+                    # 连接在窗口结束前关闭，其 profile 仍应计入本窗口
+                    probe = profiler.thread_probe("tcp:4")
+                    busy_chunk(probe)
+                    profiler.release(probe)
+                    profiler.stop()
+                self.assertIn("profile saved to", out.getvalue())
+                self.assertIn("probe tcp.send: calls=1", out.getvalue())
+
+    def test_toggle_again_stops_early(self):
+        for module in MODULES:
+            with self.subTest(module=module.__name__):
+                profiler = module.Profiler(enabled=True, window=60)
+                out = io.StringIO()
+                with contextlib.redirect_stdout(out):
+                    profiler.toggle()
+                    profiler.toggle()
+                self.assertIsNone(profiler.timer)
+                self.assertIn("profiling started for 60s", out.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()